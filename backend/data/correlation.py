@@ -1,12 +1,97 @@
 import pandas as pd
+import numpy as np
 import json
+from functools import lru_cache
 
-def get_correlation(stocks):
-    with open('backend/data/correlation_matrix.json', 'r') as file:
+
+@lru_cache(maxsize=None)
+def load_correlation_matrix(file_path='backend/data/correlation_matrix.json'):
+    """
+    Lit la matrice de corrélation complète une seule fois.
+    """
+    with open(file_path, 'r') as file:
         correlation = json.load(file)
 
     columns = [item[0] for item in correlation['columns']]
     index = [item[0] for item in correlation['index']]
-    df = pd.DataFrame(correlation['data'], columns=columns, index=index)
-    filtered_correlation = df.loc[stocks, stocks]
+    return pd.DataFrame(correlation['data'], columns=columns, index=index)
+
+
+def get_correlation(stocks):
+    df = load_correlation_matrix()
+    filtered_correlation = df.loc[stocks, stocks].copy()
     return filtered_correlation
+
+
+def nearest_correlation(matrix, tol=1e-10, max_iterations=100, min_eigenvalue=1e-8):
+    """
+    Matrice de corrélation définie positive la plus proche (projections alternées de Higham avec correction de
+    Dykstra), pour réparer une matrice estimée qui n'est pas semi-définie positive.
+    """
+    y = np.array(matrix, dtype=float)
+    correction = np.zeros_like(y)
+    for _ in range(max_iterations):
+        # Projection sur les matrices semi-définies positives
+        r = y - correction
+        eigenvalues, eigenvectors = np.linalg.eigh(r)
+        x = (eigenvectors * np.maximum(eigenvalues, 0)) @ eigenvectors.T
+        correction = x - r
+
+        # Projection sur les matrices à diagonale unité
+        y_next = x.copy()
+        np.fill_diagonal(y_next, 1.0)
+        converged = np.linalg.norm(y_next - y) <= tol * np.linalg.norm(y)
+        y = y_next
+        if converged:
+            break
+
+    # Valeurs propres strictement positives pour que la décomposition de Cholesky existe
+    eigenvalues, eigenvectors = np.linalg.eigh((y + y.T) / 2)
+    y = (eigenvectors * np.maximum(eigenvalues, min_eigenvalue)) @ eigenvectors.T
+    scale = 1 / np.sqrt(np.diag(y))
+    return y * scale[:, None] * scale[None, :]
+
+
+def repair_correlation(matrix):
+    """
+    Renvoie la matrice telle quelle si elle est définie positive, sa projection sur les matrices de corrélation
+    sinon.
+    """
+    matrix = np.array(matrix, dtype=float)
+    try:
+        np.linalg.cholesky(matrix)
+        return matrix
+    except np.linalg.LinAlgError:
+        return nearest_correlation(matrix)
+
+
+@lru_cache(maxsize=None)
+def get_cholesky(stocks):
+    """
+    Décomposition de Cholesky de la matrice de corrélation (réparée si besoin), calculée une fois par ensemble de
+    tickers.
+    :param stocks: Tuple des tickers.
+    """
+    cholesky = np.linalg.cholesky(repair_correlation(get_correlation(list(stocks))))
+    cholesky.flags.writeable = False
+    return cholesky
+
+
+@lru_cache(maxsize=None)
+def get_factor_loadings(stocks, num_factors):
+    """
+    Modèle à facteurs de la corrélation : num_factors facteurs communs (plus grandes valeurs propres) et un terme
+    idiosyncratique qui garde une variance unitaire pour chaque sous-jacent. Calculé une fois par ensemble de tickers.
+    :param stocks: Tuple des tickers.
+    :param num_factors: Nombre de facteurs communs.
+    :return: Sensibilités aux facteurs (nb_actifs x num_factors) et volatilités idiosyncratiques (nb_actifs).
+    """
+    correlation = repair_correlation(get_correlation(list(stocks)))
+    num_factors = min(num_factors, len(stocks))
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+    largest = np.argsort(eigenvalues)[::-1][:num_factors]
+    loadings = eigenvectors[:, largest] * np.sqrt(np.maximum(eigenvalues[largest], 0))
+    idiosyncratic = np.sqrt(np.maximum(1 - (loadings ** 2).sum(axis=1), 0))
+    loadings.flags.writeable = False
+    idiosyncratic.flags.writeable = False
+    return loadings, idiosyncratic
@@ -11,6 +11,7 @@ class ZeroCouponCurve:
         """
         self.date = date
         self.data = self.get_data_from_json()
+        self.interp_func = None
 
     def get_data_from_json(self):
         """
@@ -54,6 +55,15 @@ class ZeroCouponCurve:
 
         return df/100
 
+    def interpolator(self):
+        """
+        Fonction d'interpolation du taux en fonction de la maturité en années, créée une seule fois.
+        """
+        if self.interp_func is None:
+            self.interp_func = interp1d(self.data['maturity_in_years'], self.data['rates'], kind='linear',
+                                        fill_value='extrapolate')
+        return self.interp_func
+
     def interpolate_rate(self, date):
         """
         Interpole la courbe des taux pour une date cible.
@@ -62,10 +72,7 @@ class ZeroCouponCurve:
         days = (date - datetime.strptime(self.date, '%Y%m%d')).days
         date_in_year = days / 365.0
 
-        # Créer une fonction d'interpolation
-        interp_func = interp1d(self.data['maturity_in_years'], self.data['rates'], kind='linear', fill_value='extrapolate')
-
         # Utiliser la fonction d'interpolation pour obtenir le taux à la date cible
-        interpolated_rate = interp_func(date_in_year).tolist()
+        interpolated_rate = self.interpolator()(date_in_year).tolist()
 
         return interpolated_rate
\ No newline at end of file
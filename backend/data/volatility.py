@@ -1,8 +1,9 @@
-from scipy.optimize import fsolve
+import time
+from scipy.optimize import fsolve, least_squares
 from datetime import datetime
 import pandas as pd
 import numpy as np
-from backend.models import Models
+from backend.models import black_scholes_greeks
 import matplotlib.pyplot as plt
 from matplotlib import cm
 import matplotlib.dates
@@ -12,42 +13,207 @@ from dateutil.relativedelta import relativedelta
 pd.options.mode.chained_assignment = None
 
 
-def split_equity_info(equity_info):
-    components = equity_info.split()
-    ticker = components[0].replace("('", "")
-    maturity_date = components[2]
-    option_type = components[3][0]  # 'C' or 'P'
-    strike = components[3][1:]
-    return pd.Series([ticker, option_type, maturity_date, strike])
+def read_option_chain(file_path, ticker=None, spot_price=None, moneyness_range=None):
+    """
+    Lecture en colonnes de la chaîne d'options Bloomberg : les descriptions des options sont découpées par des
+    opérations vectorisées sur les chaînes et les filtres (sous-jacent, fenêtre de moneyness) sont appliqués dès que
+    possible pour ne pas traiter les contrats inutiles.
+    :param ticker: Si renseigné, seul ce sous-jacent est gardé (ex: 'AAPL').
+    :param spot_price: Prix spot, nécessaire pour la moneyness.
+    :param moneyness_range: Bornes (basse, haute) de moneyness, None pour une borne ouverte.
+    :return: DataFrame Last_Price, Option_Type, Maturity_Date, Strike (et Ticker si aucun ticker n'est demandé).
+    """
+    with open(file_path, 'r') as f:
+        data = json.load(f)
+
+    # Clés de la forme "('AAPL US 04/19/24 C172.5 Equity', 'Last_Price')"
+    keys = pd.Series(list(data.keys()), dtype=object)
+    if ticker is not None:
+        keys = keys[keys.str.startswith(f"('{ticker} ")]
+
+    components = keys.str.split(' ', n=4, expand=True)
+    df = pd.DataFrame({'Ticker': components[0].str[2:].values,
+                       'Option_Type': components[3].str[0].map({'C': 'call', 'P': 'put'}).values,
+                       'Maturity_Date': components[2].values,
+                       'Strike': components[3].str[1:].astype(float).values,
+                       'Key': keys.values})
+
+    if moneyness_range is not None:
+        low, high = moneyness_range
+        if low is not None:
+            df = df[df['Strike'] > low * spot_price]
+        if high is not None:
+            df = df[df['Strike'] < high * spot_price]
+
+    # Un seul prix par option (date de la requête Bloomberg)
+    df['Last_Price'] = [next(iter(data[key].values()), np.nan) for key in df['Key']]
+    df['Maturity_Date'] = pd.to_datetime(df['Maturity_Date'], format='%m/%d/%y', cache=True)
+    df = df.drop(columns='Key').reset_index(drop=True)
+
+    columns = ['Last_Price', 'Option_Type', 'Maturity_Date', 'Strike']
+    if ticker is not None:
+        return df[columns]
+    return df[['Ticker'] + columns]
 
 
 def read_bloomberg_data(file_path):
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    df = pd.DataFrame(data)
-    df = df.transpose()
-    df = df.rename(columns={df.columns[0]: 'Last_Price'})
-    df = df.reset_index()
-    df[['Ticker', 'Option_Type', 'Maturity_Date', 'Strike']] = df['index'].apply(split_equity_info)
-    df = df.drop(columns=['index'])
-    df['Option_Type'] = df['Option_Type'].map({'C': 'call', 'P': 'put'})
-    df['Strike'] = df['Strike'].astype(float)
-    df['Maturity_Date'] = pd.to_datetime(df['Maturity_Date'], format='%m/%d/%y')
+    df = read_option_chain(file_path)
     df_dict = {ticker: group.drop(columns='Ticker') for ticker, group in df.groupby('Ticker')}
     return df_dict
 
 
+def benchmark_option_chain(file_path='backend/data/option.json', ticker=None):
+    """
+    Mesure le débit de lecture (lignes par seconde) de la chaîne d'options.
+    """
+    start = time.perf_counter()
+    df = read_option_chain(file_path, ticker=ticker)
+    elapsed = time.perf_counter() - start
+    return {'Lignes': len(df), 'Temps (s)': elapsed, 'Lignes par seconde': len(df) / elapsed}
+
+
 def error_function(volatility, market_price, strike, time_to_maturity, risk_free_rate, dividend_yield,
                    spot_price, option_type):
-    model = Models(spot_price, strike, risk_free_rate, time_to_maturity, dividend_yield, volatility)
-    if option_type == 'call':
-        model_price = model.black_scholes('call')
-    else:
-        model_price = model.black_scholes('put')
+    model_price = black_scholes_greeks(spot_price, strike, risk_free_rate, time_to_maturity, dividend_yield,
+                                       volatility, option_type)['price']
     error = model_price - market_price
     return error
 
 
+def ssvi_total_variance(k, theta, rho, eta, gamma):
+    """
+    Variance totale SSVI w(k, theta) = theta / 2 * (1 + rho * phi * k + sqrt((phi * k + rho)² + 1 - rho²)) en
+    log-moneyness forward k, avec theta la variance totale à la monnaie et phi(theta) = eta / theta^gamma.
+    """
+    phi = eta / np.power(theta, gamma)
+    return 0.5 * theta * (1 + rho * phi * k + np.sqrt((phi * k + rho) ** 2 + 1 - rho ** 2))
+
+
+class SVISurface:
+    # Bornes de (rho, eta, gamma), paramètres communs à toutes les maturités
+    LOWER_BOUNDS = (-0.95, 0.01, 0.05)
+    UPPER_BOUNDS = (0.95, 5.0, 0.5)
+
+    def __init__(self, volatility_data, spot_price, dividend_yield, rate_curve, min_quotes=5):
+        """
+        Surface de volatilité paramétrique SSVI : une tranche SVI par maturité cotée, de variance totale à la monnaie
+        theta croissante avec la maturité et de forme (rho, eta, gamma) commune à toutes les maturités, ce qui évite
+        les tranches dégénérées et les changements de signe du skew d'une maturité à l'autre.
+        Entre les maturités, theta est interpolé linéairement ; en dehors, la variance par an est constante. Au-delà
+        des log-moneyness cotées, la variance totale est gardée plate.
+        :param volatility_data: Volatilités implicites (Dates_In_Years, Strike, Implied_Volatility).
+        :param min_quotes: Nombre minimal de cotations pour calibrer une maturité.
+        """
+        self.spot_price = spot_price
+        self.dividend_yield = dividend_yield
+        self.rate = rate_curve.interpolator()
+        self.params = self.calibrate(volatility_data, min_quotes)
+        self.maturities = self.params.index.values
+        self.theta = self.params['theta'].values
+        self.k_min = self.params['k_min'].values
+        self.k_max = self.params['k_max'].values
+        self.rho, self.eta, self.gamma = self.params[['rho', 'eta', 'gamma']].values[0]
+
+    def forward(self, t):
+        return self.spot_price * np.exp((self.rate(t) - self.dividend_yield) * t)
+
+    def calibrate(self, volatility_data, min_quotes):
+        """
+        Calibre en une fois theta par maturité et (rho, eta, gamma) communs, avec l'erreur quadratique moyenne en
+        volatilité par maturité et les paramètres arrivés sur une borne (colonne bound_hit).
+        """
+        slices = []
+        for maturity, quotes in volatility_data.groupby('Dates_In_Years'):
+            if len(quotes) >= min_quotes:
+                k = np.log(quotes['Strike'].values / self.forward(maturity))
+                slices.append((maturity, k, quotes['Implied_Volatility'].values))
+
+        columns = ['theta', 'rho', 'eta', 'gamma', 'k_min', 'k_max', 'rmse', 'bound_hit']
+        if not slices:
+            # Pas assez de cotations : surface plate à la volatilité moyenne
+            maturity = volatility_data['Dates_In_Years'].median()
+            row = [volatility_data['Implied_Volatility'].mean() ** 2 * maturity, 0.0, 0.01, 0.05, 0.0, 0.0, np.nan, '']
+            params = pd.DataFrame([row], index=[maturity], columns=columns)
+            params.index.name = 'Dates_In_Years'
+            return params
+
+        x, bound_hit = self.calibrate_slices(slices)
+        rho, eta, gamma = x[:3]
+        thetas = np.cumsum(x[3:])
+
+        rows = {}
+        for (maturity, k, volatilities), theta in zip(slices, thetas):
+            fitted = np.sqrt(ssvi_total_variance(k, theta, rho, eta, gamma) / maturity)
+            rows[maturity] = [theta, rho, eta, gamma, k.min(), k.max(), np.sqrt(np.mean((fitted - volatilities) ** 2)),
+                              ', '.join(bound_hit)]
+
+        params = pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+        params.index.name = 'Dates_In_Years'
+        return params
+
+    @classmethod
+    def calibrate_slices(cls, slices):
+        """
+        Moindres carrés robustes sur les volatilités de toutes les maturités (le saut put/call à la monnaie ne doit pas
+        imposer le skew). Les inconnues sont (rho, eta, gamma) puis les accroissements positifs de theta (pas
+        d'arbitrage calendaire) ; la condition eta * (1 + |rho|) <= 2 (pas d'arbitrage papillon) est imposée par
+        pénalité.
+        :return: Paramètres calibrés et noms des paramètres arrivés sur une borne.
+        """
+        maturities = np.concatenate([np.full(len(k), maturity) for maturity, k, _ in slices])
+        k = np.concatenate([k for _, k, _ in slices])
+        volatilities = np.concatenate([volatilities for _, _, volatilities in slices])
+        slice_index = np.repeat(np.arange(len(slices)), [len(k) for _, k, _ in slices])
+
+        def residuals(x):
+            rho, eta, gamma = x[:3]
+            theta = np.cumsum(x[3:])[slice_index]
+            fitted = np.sqrt(ssvi_total_variance(k, theta, rho, eta, gamma) / maturities)
+            return np.append(fitted - volatilities, 10 * max(eta * (1 + abs(rho)) - 2, 0))
+
+        # Départ : variance totale moyenne de chaque maturité, rendue croissante
+        thetas = np.maximum.accumulate([np.mean(vols ** 2) * maturity for maturity, _, vols in slices])
+        x0 = np.concatenate([[0.0, 0.5, 0.25], np.diff(thetas, prepend=0.0) + 1e-6])
+        lower = np.concatenate([cls.LOWER_BOUNDS, np.full(len(slices), 1e-8)])
+        upper = np.concatenate([cls.UPPER_BOUNDS, np.full(len(slices), np.inf)])
+        x = least_squares(residuals, x0, bounds=(lower, upper), loss='soft_l1', f_scale=0.01).x
+
+        names = ['rho', 'eta', 'gamma']
+        bound_hit = [name for name, value, low, high in zip(names, x, lower, upper)
+                     if np.isclose(value, low, atol=1e-4) or np.isclose(value, high, atol=1e-4)]
+        if np.any(x[4:] <= 1e-6):
+            bound_hit.append('theta')
+        return x, bound_hit
+
+    def atm_total_variance(self, t):
+        """
+        Variance totale à la monnaie theta(t) : linéaire entre les maturités calibrées, à variance par an constante
+        en dehors.
+        """
+        first, last = self.maturities[0], self.maturities[-1]
+        return np.where(t < first, self.theta[0] * t / first,
+                        np.where(t > last, self.theta[-1] * t / last, np.interp(t, self.maturities, self.theta)))
+
+    def implied_volatility(self, t, strike):
+        """
+        Volatilité implicite sur des tableaux (broadcastables) de maturités en années et de strikes.
+        """
+        t, strike = np.broadcast_arrays(np.asarray(t, dtype=float), np.asarray(strike, dtype=float))
+        t = np.maximum(t, 1e-8)
+        k = np.log(strike / self.forward(t))
+
+        # Variance totale plate au-delà des log-moneyness cotées (interpolées entre les maturités)
+        k = np.clip(k, np.interp(t, self.maturities, self.k_min), np.interp(t, self.maturities, self.k_max))
+        variance = ssvi_total_variance(k, self.atm_total_variance(t), self.rho, self.eta, self.gamma) / t
+        return np.sqrt(np.maximum(variance, 0.0))
+
+    def __call__(self, points):
+        """
+        Même appel qu'un interpolateur scipy : points = (maturités en années, strikes).
+        """
+        return self.implied_volatility(*points)
+
+
 class Volatility:
     def __init__(self, stock, pricing_date, rate):
         self.spot_price = stock.spot_price
@@ -56,45 +222,46 @@ class Volatility:
         self.rate = rate
         self.dividend_yield = stock.dividend_yield
         self.data = self.calculate_volatility_surface()
+        self.interp_func = None
+
+    def interpolator(self):
+        """
+        Surface SVI calibrée sur les volatilités implicites, créée une seule fois et partagée par les simulations et
+        les graphiques. S'appelle avec (maturité en années, strike).
+        """
+        if self.interp_func is None:
+            self.interp_func = SVISurface(self.data, self.spot_price, self.dividend_yield, self.rate)
+        return self.interp_func
 
     def calculate_volatility_surface(self):
-        bloomberg_data = read_bloomberg_data('backend/data/option.json')
-        option_data = bloomberg_data[self.tickers]
-        option_data['Moneyness'] = option_data['Strike'].apply(lambda x: x / self.spot_price)
+        # Seules les options du sous-jacent au-dessus de la borne basse de moneyness sont lues (la borne haute est
+        # appliquée après le filtre par maturité, qui a besoin des strikes les plus hauts)
+        option_data = read_option_chain('backend/data/option.json', ticker=self.tickers, spot_price=self.spot_price,
+                                        moneyness_range=(0.85, None))
+        option_data['Moneyness'] = option_data['Strike'] / self.spot_price
 
         calls, puts = self.filter_moneyness(option_data)
-
-        for date in option_data['Maturity_Date'].unique():
-
-            if isinstance(date, np.datetime64):
-                date = date.astype('M8[ms]').astype(datetime)
-
-            r = self.rate.interpolate_rate(date=date)
-            d = self.dividend_yield
-
-            volatility_surface = pd.DataFrame()
-
-            # Calculate implied volatility for calls and puts
-            calls['Implied_Volatility'] = calls.apply(lambda row: fsolve(error_function, 0.2, args=(
-            row['Last_Price'], row['Strike'], (date - self.pricing_date).days / 365.0, r, d, self.spot_price, 'call'))[
-                0], axis=1)
-            puts['Implied_Volatility'] = puts.apply(lambda row: fsolve(error_function, 0.2, args=(
-            row['Last_Price'], row['Strike'], (date - self.pricing_date).days / 365.0, r, d, self.spot_price, 'put'))[
-                0], axis=1)
-
-            # Concatenate calls and puts and add to the volatility surface DataFrame
-            volatility_surface = pd.concat([volatility_surface, pd.concat([puts, calls])])
-
-            # Pour l'interpolation
-            def calculate_years(date):
-                return (date - self.pricing_date).days / 365.0
-
-            volatility_surface['Dates_In_Years'] = volatility_surface['Maturity_Date'].apply(calculate_years)
+        volatility_surface = pd.concat([puts, calls])
 
         # Filtre par maturité
         three_months_later = self.pricing_date + relativedelta(months=3)
         volatility_surface = volatility_surface[volatility_surface['Maturity_Date'] > three_months_later]
 
+        # Pour l'interpolation
+        volatility_surface['Dates_In_Years'] = (volatility_surface['Maturity_Date'] - self.pricing_date).dt.days / 365.0
+
+        # Taux interpolé une seule fois par maturité
+        maturities = volatility_surface['Maturity_Date'].drop_duplicates()
+        rates = dict(zip(maturities, [self.rate.interpolate_rate(date=date) for date in maturities]))
+        volatility_surface['Rate'] = volatility_surface['Maturity_Date'].map(rates)
+
+        # Volatilité implicite de chaque option avec sa propre maturité et son propre taux
+        d = self.dividend_yield
+        volatility_surface['Implied_Volatility'] = volatility_surface.apply(lambda row: fsolve(
+            error_function, 0.2, args=(row['Last_Price'], row['Strike'], row['Dates_In_Years'], row['Rate'], d,
+                                       self.spot_price, row['Option_Type']))[0], axis=1)
+        volatility_surface = volatility_surface.drop(columns='Rate')
+
         # On filtre les extrêmes
         q_low = volatility_surface['Implied_Volatility'].quantile(0.10)
         q_high = volatility_surface['Implied_Volatility'].quantile(0.90)
@@ -104,7 +271,7 @@ class Volatility:
         return volatility_surface
 
     def filter_moneyness(self, option_df, moneyness_range=[0.85, 1.15]):
-        option_df = option_df.groupby('Maturity_Date').filter(lambda group: group['Moneyness'].max() > 1.1)
+        option_df = option_df[option_df.groupby('Maturity_Date')['Moneyness'].transform('max') > 1.1]
         calls = option_df[option_df['Option_Type'] == 'call']
         calls = calls[(calls['Strike'] > self.spot_price) &
                       (calls['Strike'] < moneyness_range[1] * self.spot_price)]
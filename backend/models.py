@@ -1,12 +1,81 @@
+import time
 import numpy as np
 import pandas as pd
-from scipy.stats import norm
+from scipy.special import ndtr
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from backend.data.rate_curve import ZeroCouponCurve
 from datetime import timedelta
 
 
+def black_scholes_greeks(spot_price, strike, risk_free_rate, maturity, dividend_yield, volatility,
+                         call_or_put='call'):
+    """
+    Prix et grecques analytiques de Black-Scholes sur des tableaux de paramètres (broadcastables entre eux).
+    Les termes intermédiaires (d1, d2, actualisations, densité) sont calculés une seule fois pour toutes les sorties.
+    :param call_or_put: 'call', 'put', ou tableau de booléens (True pour un call) ou de chaînes 'call'/'put'.
+    :return: Dictionnaire de tableaux 'price', 'delta', 'gamma', 'vega' et 'rho'.
+    """
+    spot_price = np.asarray(spot_price, dtype=float)
+    strike = np.asarray(strike, dtype=float)
+    risk_free_rate = np.asarray(risk_free_rate, dtype=float)
+    maturity = np.asarray(maturity, dtype=float)
+    dividend_yield = np.asarray(dividend_yield, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+
+    if isinstance(call_or_put, str):
+        if call_or_put not in ('call', 'put'):
+            raise ValueError("Type d'option non reconnu.")
+        sign = 1.0 if call_or_put == 'call' else -1.0
+    else:
+        call_or_put = np.asarray(call_or_put)
+        if call_or_put.dtype.kind in 'biu':
+            is_call = call_or_put.astype(bool)
+        else:
+            if not np.isin(call_or_put, ['call', 'put']).all():
+                raise ValueError("Type d'option non reconnu.")
+            is_call = call_or_put == 'call'
+        sign = np.where(is_call, 1.0, -1.0)
+
+    sqrt_maturity = np.sqrt(maturity)
+    vol_sqrt_maturity = volatility * sqrt_maturity
+    d1 = (np.log(spot_price / strike) + (risk_free_rate - dividend_yield + 0.5 * volatility ** 2) * maturity) / \
+        vol_sqrt_maturity
+    d2 = d1 - vol_sqrt_maturity
+
+    forward_discount = np.exp(-dividend_yield * maturity)
+    strike_discount = strike * np.exp(-risk_free_rate * maturity)
+    n_d1 = ndtr(sign * d1)
+    n_d2 = ndtr(sign * d2)
+    pdf_d1 = np.exp(-0.5 * d1 ** 2) / np.sqrt(2 * np.pi)
+    spot_discount = spot_price * forward_discount
+
+    return {'price': sign * (spot_discount * n_d1 - strike_discount * n_d2),
+            'delta': sign * forward_discount * n_d1,
+            'gamma': forward_discount * pdf_d1 / (spot_price * vol_sqrt_maturity),
+            'vega': spot_discount * pdf_d1 * sqrt_maturity,
+            'rho': sign * strike_discount * maturity * n_d2}
+
+
+def benchmark_black_scholes(num_options=1_000_000, seed=0):
+    """
+    Mesure le débit (options par seconde) de black_scholes_greeks sur un lot d'options aléatoires.
+    """
+    rng = np.random.default_rng(seed)
+    spot_price = rng.uniform(50, 150, num_options)
+    strike = rng.uniform(50, 150, num_options)
+    risk_free_rate = rng.uniform(0.0, 0.06, num_options)
+    maturity = rng.uniform(0.1, 5.0, num_options)
+    dividend_yield = rng.uniform(0.0, 0.03, num_options)
+    volatility = rng.uniform(0.1, 0.6, num_options)
+    is_call = rng.random(num_options) < 0.5
+
+    start = time.perf_counter()
+    black_scholes_greeks(spot_price, strike, risk_free_rate, maturity, dividend_yield, volatility, is_call)
+    elapsed = time.perf_counter() - start
+    return {'Options': num_options, 'Temps (s)': elapsed, 'Options par seconde': num_options / elapsed}
+
+
 class Models:
     def __init__(self, spot_price, strike, risk_free_rate, maturity, dividend_yield, volatility):
         self.spot_price = spot_price
@@ -17,16 +86,8 @@ class Models:
         self.volatility = volatility
 
     def black_scholes(self, call_or_put='call'):
-        d1 = (np.log(self.spot_price / self.strike) + (
-                self.risk_free_rate - self.dividend_yield + 0.5 * self.volatility ** 2) * self.maturity) / (
-                     self.volatility * np.sqrt(self.maturity))
-        d2 = d1 - self.volatility * np.sqrt(self.maturity)
-        if call_or_put == 'call':
-            return self.spot_price * np.exp(-self.dividend_yield * self.maturity) * norm.cdf(d1) - self.strike * np.exp(
-                -self.risk_free_rate * self.maturity) * norm.cdf(d2)
-        elif call_or_put == 'put':
-            return self.strike * np.exp(-self.risk_free_rate * self.maturity) * norm.cdf(
-                -d2) - self.spot_price * np.exp(-self.dividend_yield * self.maturity) * norm.cdf(-d1)
+        return black_scholes_greeks(self.spot_price, self.strike, self.risk_free_rate, self.maturity,
+                                    self.dividend_yield, self.volatility, call_or_put)['price']
 
 
 class Autocall:
@@ -48,117 +109,86 @@ class Autocall:
         date = self.monte_carlo.start_date + timedelta(days=time * self.monte_carlo.day_conv)
         return np.exp(-self.risk_free.interpolate_rate(date=date) * time)
 
+    def discount_factors(self, num_steps):
+        """
+        Facteurs d'actualisation de chaque date d'observation, plus celui de la maturité (perte en capital).
+        """
+        return np.array([self.discount_factor(step, num_steps) for step in range(num_steps + 1)])
+
+    def performance_ratios(self, prices, initial_prices):
+        """
+        Ratios de performance retenus par la stratégie à partir de prix de forme (..., nb_dates, nb_simulations,
+        nb_actifs) : premier actif en mono, pire ou meilleur des actifs sinon.
+        """
+        ratios = prices / initial_prices
+        if self.strat == "mono":
+            return ratios[..., 0]
+        elif self.strat == "best-off":
+            return ratios.max(axis=-1)
+        return ratios.min(axis=-1)
+
+    def evaluate_ratios(self, ratios, discounts=None):
+        """
+        Évalue les paiements de l'autocall de façon vectorisée sur des ratios de performance de forme
+        (..., nb_observations, nb_simulations). Les dimensions supplémentaires (scénarios, ...) sont conservées.
+        """
+        num_steps = ratios.shape[-2]
+        if discounts is None:
+            discounts = self.discount_factors(num_steps)
+
+        coupon_condition = ratios >= self.coupon_barrier
+        autocall_condition = ratios >= self.autocall_barrier
+
+        # Le contrat est toujours vivant si le ratio n'a jamais dépassé la barrière d'autocall aux dates précédentes
+        past_max = np.maximum.accumulate(ratios, axis=-2)
+        no_redemption_condition = np.ones_like(coupon_condition)
+        no_redemption_condition[..., 1:, :] = past_max[..., :-1, :] <= self.autocall_barrier
+
+        # À la dernière date, le nominal est remboursé si le contrat est encore vivant
+        autocall_condition[..., -1, :] |= no_redemption_condition[..., -1, :]
+
+        payoffs = self.nominal * (self.coupon_rate * coupon_condition + autocall_condition) * no_redemption_condition
+        autocall_matrix = (autocall_condition & no_redemption_condition).astype(float)
+        autocall_matrix[..., -1, :] = 0
+
+        # Barrière put : perte en capital si le contrat est vivant à maturité, que la barrière a été franchie et
+        # que le dernier ratio est inférieur à 1
+        final_ratios = ratios[..., -1, :]
+        put_condition = ratios.min(axis=-2) <= self.put_barrier
+        loss = no_redemption_condition[..., -1, :] & put_condition & (final_ratios < 1)
+
+        discounted_payoffs = payoffs * discounts[:num_steps, None]
+        payoffs = np.where(loss[..., None, :], 0.0, payoffs)
+        discounted_payoffs = np.where(loss[..., None, :], 0.0, discounted_payoffs)
+        payoffs[..., -1, :] = np.where(loss, self.nominal * final_ratios, payoffs[..., -1, :])
+        discounted_payoffs[..., -1, :] = np.where(loss, payoffs[..., -1, :] * discounts[num_steps],
+                                                  discounted_payoffs[..., -1, :])
+
+        return payoffs, discounted_payoffs, autocall_matrix
+
     def generate_payoffs(self):
-        # Obtenir le nombre d'étapes et de simulations pour l'actif actuel
-        num_steps = len(self.monte_carlo.observation_dates)
-        num_simulations = self.monte_carlo.num_simu
+        # Prix aux dates d'observation de forme (nb_dates, nb_simulations, nb_actifs), lus directement dans les
+        # chemins simulés (éventuellement stockés sur disque)
+        paths = self.monte_carlo.paths
+        observation_steps = self.monte_carlo.simulation_dates.get_indexer(self.monte_carlo.observation_dates)
+        ratios = self.performance_ratios(paths[observation_steps], paths[0])
 
-        # Initialiser des tableaux pour stocker les payoffs, les payoffs actualisés et les autocalls à chaque
-        # étape pour chaque simulation
-        payoffs_actif = np.zeros((num_steps, num_simulations))
-        discounted_payoffs_actif = np.zeros((num_steps, num_simulations))
-        autocall_matrix = np.zeros((num_steps, num_simulations))  # Nouvelle matrice pour stocker les autocalls
+        payoffs_actif, discounted_payoffs_actif, self.autocall_matrix = self.evaluate_ratios(ratios)
 
-        if self.strat == "mono":
-            df = self.monte_carlo.simulations[0]
-        else:
-            df = self.choice_asset_worstoff_bestoff()
-
-        for step, time_step in enumerate(self.monte_carlo.observation_dates):
-            total_payment, no_redemption_condition, autocall_occurred = self.payoff_by_step(df, step, time_step)
-
-            # Stocker le paiement total, le paiement total actualisé et les autocalls à l'étape courante
-            payoffs_actif[step, :] = total_payment
-            discount = self.discount_factor(step, num_steps)
-            discounted_payoffs_actif[step, :] = (total_payment * discount)
-            autocall_matrix[step, :] = autocall_occurred
-
-        # ------------------------------------------------------------------------------------------------------------
-        # Barrière Put
-        filter_df = df.loc[self.monte_carlo.observation_dates]
-        # Je regarde le plus petit ratio de prix sur toutes les observations dates
-        initial_prices = df.iloc[0].values
-        min_price_ratios = filter_df.min(axis=0) / initial_prices
-        # Si le plus petit des ratios est inférieur à la barrière put alors cette barrière a été franchit
-        put_condition = min_price_ratios <= self.put_barrier
-        final_price_ratios = filter_df.iloc[-1].values / initial_prices
-
-        # Boucle sur toutes les simulations
-        for i in range(len(no_redemption_condition)):
-            # Si il n'y a pas eu déjà de redemption, que le barrière put a au moins été franchit une fois et que le
-            # dernier prix est inférieur au prix initial alors il faut imputer la perte
-            if no_redemption_condition[i] and put_condition[i] and (final_price_ratios[i] < 1):
-                # J'annule tous les paiements de coupons précédents
-                payoffs_actif[:, i] = discounted_payoffs_actif[:, i] = 0
-                # Inputer la perte sur le dernier payoff
-                payoffs_actif[-1, i] = self.nominal * final_price_ratios[i]
-
-                discount = self.discount_factor(num_steps, num_steps)
-                discounted_payoffs_actif[-1, i] = (payoffs_actif[-1, i] * discount)
-        # ------------------------------------------------------------------------------------------------------------
-
-        # Créer des DataFrames pour les payoffs et les payoffs actualisés et les ajouter aux listes
+        return self.payoff_dataframes(payoffs_actif, discounted_payoffs_actif)
+
+    def payoff_dataframes(self, payoffs_actif, discounted_payoffs_actif):
+        """
+        Crée les DataFrames des payoffs et des payoffs actualisés (dates d'observation x simulations).
+        """
+        num_simulations = self.monte_carlo.num_simu
         df_payoffs = pd.DataFrame(payoffs_actif, index=self.monte_carlo.observation_dates,
                                   columns=[f'Simulation {sim + 1}' for sim in range(num_simulations)])
         df_discounted_payoffs = pd.DataFrame(discounted_payoffs_actif, index=self.monte_carlo.observation_dates,
                                              columns=[f'Simulation {sim + 1}' for sim in range(num_simulations)])
-        self.autocall_matrix = autocall_matrix
 
         return df_payoffs, df_discounted_payoffs
 
-    def payoff_by_step(self, df, step, time_step):
-        # Obtenir les prix courants et les prix initiaux pour calculer les ratios de prix
-        current_prices = df.loc[time_step].values
-        initial_prices = df.iloc[0].values
-        price_ratios = current_prices / initial_prices
-
-        # Calculer les conditions de paiement du coupon et d'autocall basées sur les ratios de prix
-        coupon_condition = price_ratios >= self.coupon_barrier
-        autocall_condition = price_ratios >= self.autocall_barrier
-
-        # S'assurer que le prix n'a jamais dépassé l'autocall barrière dans le passé sinon fin de contrat
-        if step > 0:
-            # Filtrer df pour ces dates d'observation
-            filter_df = df.loc[self.monte_carlo.observation_dates[:step]]
-            # Calculer max_price_ratios en se basant sur les prix filtrés
-            max_price_ratios = filter_df.max(axis=0) / initial_prices
-            no_redemption_condition = max_price_ratios <= self.autocall_barrier
-        else:
-            # Si nous sommes à la première observation, utiliser les ratios actuels comme max_ratios
-            max_price_ratios = price_ratios
-            no_redemption_condition = True
-
-        num_steps = len(self.monte_carlo.observation_dates)
-        # À la dernière étape, s'assurer de payer le nominal si la barrière put n'a pas été franchit et si les
-        # conditions d'autocall ne sont pas remplies
-        if step == (num_steps - 1):
-            for i in range(len(no_redemption_condition)):
-                if bool(no_redemption_condition[i]):
-                    no_redemption_condition[i] = autocall_condition[i] = True
-
-        # Calculer les paiements de coupon et de rachat, puis le paiement total pour chaque simulation
-        coupon_payment = self.nominal * self.coupon_rate * coupon_condition * no_redemption_condition
-        redemption_payment = self.nominal * autocall_condition * no_redemption_condition
-        total_payment = coupon_payment + redemption_payment
-
-        autocall_occurred = np.zeros_like(total_payment)
-        if step != (num_steps - 1):
-            autocall_occurred[autocall_condition & no_redemption_condition] = 1
-
-        return total_payment, no_redemption_condition, autocall_occurred
-
-    def choice_asset_worstoff_bestoff(self):
-        normalized_dfs = [df / df.iloc[0, 0] for df in self.monte_carlo.simulations]
-
-        if self.strat == "best-off":
-            max_df = np.maximum.reduce(normalized_dfs)
-        else:
-            max_df = np.minimum.reduce(normalized_dfs)
-
-        result_df = pd.DataFrame(max_df, index=self.monte_carlo.simulations[0].index,
-                                 columns=self.monte_carlo.simulations[0].columns)
-        return result_df
-
     def calculate_average_present_value(self):
         """Calcule la valeur présente moyenne pour chaque actif et la moyenne globale."""
         total_discounted = self.payoffs_discount.sum(axis=0)
@@ -184,3 +214,81 @@ class Autocall:
         df_proba = pd.DataFrame(list(autocall_probabilities_dict.items()), columns=['Date de constatation',
                                                                                     'Probabilité'])
         return df_proba.T
+
+
+class FusedAutocall(Autocall):
+    """
+    Autocall évalué pendant la simulation : les conditions de coupon et d'autocall sont testées à chaque date
+    d'observation et les chemins remboursés sont retirés de la simulation, les pas suivants ne portant que sur les
+    chemins encore vivants. La simulation s'arrête à la dernière date d'observation.
+    Le MonteCarlo doit être créé avec simulate=False et garder ses chocs en mémoire (sans path_store) ; les résultats
+    sont identiques à ceux d'un Autocall construit sur le même MonteCarlo simulé.
+    """
+
+    def generate_payoffs(self):
+        mc = self.monte_carlo
+        if mc.z is None:
+            raise ValueError("Le moteur fusionné nécessite un MonteCarlo dont les chocs sont gardés en mémoire.")
+        if mc.paths is not None:
+            raise ValueError("Le moteur fusionné simule lui-même les chemins : créer le MonteCarlo avec "
+                             "simulate=False.")
+        num_steps = len(mc.observation_dates)
+        num_simulations = mc.num_simu
+        observation_steps = mc.simulation_dates.get_indexer(mc.observation_dates)
+        discounts = self.discount_factors(num_steps)
+        volatilities = mc.volatility_interpolators()
+        rates = mc.rate_interpolators()
+        dt = mc.delta_t
+
+        payoffs_actif = np.zeros((num_steps, num_simulations))
+        self.autocall_matrix = np.zeros((num_steps, num_simulations))
+        loss = np.array([], dtype=int)
+
+        # Chemins vivants : indices des simulations, prix courants et plus petit ratio observé
+        active = np.arange(num_simulations)
+        prices = np.tile(mc.spots, (num_simulations, 1))
+        min_ratios = np.full(num_simulations, np.inf)
+        simulated_path_steps = 0
+
+        t = 0
+        for step, observation_step in enumerate(observation_steps):
+            # Simuler les chemins vivants jusqu'à la date d'observation
+            while t < observation_step:
+                t += 1
+                t_in_years = t / mc.day_conv
+                z = mc.z[t - 1, active]
+                for i in range(len(mc.spots)):
+                    volatility = volatilities[i]((t_in_years, prices[:, i]))
+                    rate = rates[i](t_in_years)
+                    prices[:, i] = prices[:, i] * np.exp(
+                        (rate - mc.dividend_yields[i] - 0.5 * volatility ** 2) * dt + volatility * z[:, i])
+                simulated_path_steps += len(active)
+
+            ratios = self.performance_ratios(prices, mc.spots)
+            min_ratios = np.minimum(min_ratios, ratios)
+            coupon_condition = ratios >= self.coupon_barrier
+
+            if step == num_steps - 1:
+                # À la dernière date, le nominal est remboursé sauf si la barrière put a été franchie et que le
+                # dernier ratio est inférieur à 1 : on annule alors les coupons et on impute la perte
+                payoffs_actif[step, active] = self.nominal * (self.coupon_rate * coupon_condition + 1)
+                put_condition = (min_ratios <= self.put_barrier) & (ratios < 1)
+                loss = active[put_condition]
+                payoffs_actif[:, loss] = 0
+                payoffs_actif[step, loss] = self.nominal * ratios[put_condition]
+            else:
+                autocall_condition = ratios >= self.autocall_barrier
+                payoffs_actif[step, active] = self.nominal * (self.coupon_rate * coupon_condition + autocall_condition)
+                self.autocall_matrix[step, active] = autocall_condition
+
+                # Retirer les chemins remboursés
+                alive = ratios <= self.autocall_barrier
+                active, prices, min_ratios = active[alive], prices[alive], min_ratios[alive]
+
+        discounted_payoffs_actif = payoffs_actif * discounts[:num_steps, None]
+        discounted_payoffs_actif[-1, loss] = payoffs_actif[-1, loss] * discounts[num_steps]
+
+        # Part des pas de simulation évités par rapport à la simulation complète des chemins
+        self.work_saved = 1 - simulated_path_steps / (mc.num_time_steps * num_simulations)
+
+        return self.payoff_dataframes(payoffs_actif, discounted_payoffs_actif)
@@ -1,17 +1,23 @@
 import numpy as np
 from datetime import datetime
-from scipy.interpolate import NearestNDInterpolator, interp1d
-from backend.data.correlation import get_correlation
+from backend.data.correlation import get_correlation, get_cholesky, get_factor_loadings
 import pandas as pd
 
 
 class MonteCarlo:
     def __init__(self, stocks, start_date, end_date, num_simu=10000, day_conv=360, seed=None,
-                 observation_frequency='monthly'):
+                 observation_frequency='monthly', path_store=None, num_factors=None, simulate=True):
         """
         Initialisation avec prise en compte de la fréquence d'observation.
+        :param path_store: PathStore optionnel dans lequel les chemins sont écrits au fur et à mesure de la
+        simulation au lieu d'être gardés en mémoire.
+        :param num_factors: Si renseigné, les chocs sont corrélés par un modèle à num_factors facteurs communs plus
+        un terme idiosyncratique (coût en O(n * num_factors) au lieu de O(n²) pour les grands paniers).
+        :param simulate: Si False, seuls les chocs sont générés et les chemins sont simulés par le moteur qui les
+        utilise (ex : FusedAutocall).
         """
         self.stocks = stocks
+        self.tickers = [stock.ticker for stock in stocks]
         self.spots = np.array([stock.spot_price for stock in stocks])
         self.start_date = datetime.strptime(start_date, "%Y-%m-%d")
         self.end_date = datetime.strptime(end_date, "%Y-%m-%d")
@@ -23,6 +29,8 @@ class MonteCarlo:
         self.num_time_steps = int(self.maturity * day_conv)
         self.delta_t = self.maturity / day_conv
         self.seed = seed
+        self.path_store = path_store
+        self.num_factors = num_factors
 
         self.simulation_dates = pd.date_range(start=self.start_date, end=self.end_date).normalize()
         self.num_steps = None
@@ -30,8 +38,11 @@ class MonteCarlo:
         self.observation_dates = self.generate_observation_dates()
 
         self.generate_correlated_shocks()
-        self.simulations = self.simulate_correlated_prices()
-        self.stocks_nb = len(self.simulations)
+        if simulate:
+            self.simulations = self.simulate_correlated_prices()
+        else:
+            self.paths = self.simulations = None
+        self.stocks_nb = len(stocks)
 
     def generate_observation_dates(self):
         """
@@ -55,51 +66,118 @@ class MonteCarlo:
 
     def generate_correlated_shocks(self):
         """
-        Génère des chocs corrélés pour tous les sous-jacents en utilisant la décomposition de Cholesky.
+        Génère des chocs corrélés pour tous les sous-jacents en utilisant la décomposition de Cholesky ou le modèle à
+        facteurs. Les décompositions sont mises en cache par ensemble de tickers.
         """
         if self.seed is not None:
             np.random.seed(self.seed)
-        L = np.linalg.cholesky(self.correlation_matrix)
-        z_uncorrelated = np.random.normal(0.0, 1.0,
-                                          (self.num_time_steps, self.num_simu, len(self.spots))) * self.delta_t ** 0.5
-        self.z = np.einsum('ij, tkj -> tki', L, z_uncorrelated)
+        if self.num_factors is None:
+            self.cholesky = get_cholesky(tuple(self.tickers))
+        else:
+            self.loadings, self.idiosyncratic = get_factor_loadings(tuple(self.tickers), self.num_factors)
+        if self.path_store is None:
+            self.z = self.correlated_shocks(self.num_time_steps)
+        else:
+            # Les chocs sont tirés pas à pas pendant la simulation pour ne pas être gardés en mémoire (les tirages
+            # sont identiques à ceux d'un tirage en une fois)
+            self.z = None
+
+    def correlated_shocks(self, num_steps):
+        """
+        Tire les chocs corrélés de num_steps pas de temps.
+        """
+        if self.num_factors is None:
+            z_uncorrelated = np.random.normal(0.0, 1.0, (num_steps, self.num_simu, len(self.spots)))
+            return (z_uncorrelated @ self.cholesky.T) * self.delta_t ** 0.5
+
+        # Un seul tirage par appel, découpé en facteurs et termes idiosyncratiques, pour que les tirages pas à pas
+        # consomment le générateur dans le même ordre qu'un tirage en une fois
+        num_factors = self.loadings.shape[1]
+        z = np.random.normal(0.0, 1.0, (num_steps, self.num_simu, num_factors + len(self.spots)))
+        factors, z_idiosyncratic = z[..., :num_factors], z[..., num_factors:]
+        return (factors @ self.loadings.T + z_idiosyncratic * self.idiosyncratic) * self.delta_t ** 0.5
+
+    def effective_correlation(self):
+        """
+        Matrice de corrélation réellement utilisée pour les chocs (matrice réparée ou modèle à facteurs).
+        """
+        if self.num_factors is None:
+            return self.cholesky @ self.cholesky.T
+        return self.loadings @ self.loadings.T + np.diag(self.idiosyncratic ** 2)
+
+    def metadata(self):
+        """
+        Métadonnées de la simulation enregistrées avec les chemins stockés.
+        """
+        return {'tickers': self.tickers,
+                'spots': self.spots.tolist(),
+                'dividend_yields': self.dividend_yields.tolist(),
+                'correlation_matrix': self.effective_correlation().tolist(),
+                'factor_loadings': None if self.num_factors is None else self.loadings.tolist(),
+                'start_date': self.start_date.strftime("%Y-%m-%d"),
+                'end_date': self.end_date.strftime("%Y-%m-%d"),
+                'maturity': self.maturity,
+                'num_simu': self.num_simu,
+                'day_conv': self.day_conv,
+                'num_time_steps': self.num_time_steps,
+                'delta_t': self.delta_t,
+                'seed': self.seed,
+                'num_factors': self.num_factors,
+                'observation_frequency': self.observation_frequency,
+                'simulation_dates': [date.strftime("%Y-%m-%d") for date in self.simulation_dates]}
+
+    def volatility_interpolators(self):
+        """
+        Crée une fonction d'interpolation de la volatilité implicite (maturité, strike) pour chaque sous-jacent.
+        """
+        return [stock.volatility_surface.interpolator() for stock in self.stocks]
+
+    def rate_interpolators(self):
+        """
+        Crée une fonction d'interpolation du taux sans risque pour chaque sous-jacent.
+        """
+        return [stock.rate_curve.interpolator() for stock in self.stocks]
 
     def simulate_correlated_prices(self):
         """
         Simule les chemins de prix pour tous les sous-jacents en utilisant les chocs corrélés.
         """
         dt = self.delta_t
-        simu = np.zeros((self.num_time_steps + 1, self.num_simu, len(self.spots)))
+        shape = (self.num_time_steps + 1, self.num_simu, len(self.spots))
+        if self.path_store is None:
+            simu = np.zeros(shape)
+        else:
+            simu = self.path_store.create(shape, self.metadata())
         simu[0, :, :] = self.spots
 
         # Create an interpolation function for the volatility and rate of each stock
-        volatilities = []
-        for stock in self.stocks:
-            # Prepare the data for interpolation
-            x = stock.volatility_surface.data['Dates_In_Years']
-            y = stock.volatility_surface.data['Strike']
-            z = stock.volatility_surface.data['Implied_Volatility']
-            points = np.array([x, y]).T
-
-            # Create the interpolator
-            volatilities.append(NearestNDInterpolator(points, z))
-
-        rates = [interp1d(stock.rate_curve.data['maturity_in_years'], stock.rate_curve.data['rates'],
-                          fill_value="extrapolate") for stock in self.stocks]
+        volatilities = self.volatility_interpolators()
+        rates = self.rate_interpolators()
 
         for t in range(1, self.num_time_steps + 1):
             t_in_years = t / self.day_conv
+            z = self.z[t - 1] if self.z is not None else self.correlated_shocks(1)[0]
             for i in range(len(self.stocks)):
                 volatility = volatilities[i]((t_in_years, simu[t - 1, :, i]))
                 rate = rates[i](t_in_years)
                 simu[t, :, i] = simu[t - 1, :, i] * np.exp(
-                    (rate - self.dividend_yields[i] - 0.5 * volatility ** 2) * dt + volatility * self.z[t - 1, :, i])
+                    (rate - self.dividend_yields[i] - 0.5 * volatility ** 2) * dt + volatility * z[:, i])
+
+        if self.path_store is not None:
+            self.path_store.close()
+        self.paths = simu
 
+        return self.paths_to_dataframes(simu)
+
+    def paths_to_dataframes(self, simu):
+        """
+        Un DataFrame par sous-jacent (dates x simulations), construit sans copie des chemins.
+        """
         dataframes = []
         for asset_index in range(simu.shape[2]):
             asset_data = simu[:, :, asset_index]
             df = pd.DataFrame(asset_data, index=self.simulation_dates,
-                              columns=[f'{sim + 1}' for sim in range(self.num_simu)])
+                              columns=[f'{sim + 1}' for sim in range(self.num_simu)], copy=False)
             dataframes.append(df)
 
         return dataframes
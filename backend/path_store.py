@@ -0,0 +1,90 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from backend.monte_carlo import MonteCarlo
+
+
+class PathStore:
+    def __init__(self, directory):
+        """
+        Stockage sur disque des chemins simulés : un fichier .npy lu en memmap de forme (nb_dates, nb_simulations,
+        nb_actifs) et un fichier JSON de métadonnées (dates, tickers, seed, paramètres du modèle).
+        :param directory: Répertoire du stockage.
+        """
+        self.directory = directory
+        self.paths_file = os.path.join(directory, 'paths.npy')
+        self.metadata_file = os.path.join(directory, 'metadata.json')
+        self.paths = None
+        self.metadata = None
+
+    def create(self, shape, metadata):
+        """
+        Crée le fichier des chemins en écriture, rempli au fur et à mesure de la simulation.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.metadata = dict(metadata, shape=list(shape), complete=False)
+        self.write_metadata()
+        self.paths = np.lib.format.open_memmap(self.paths_file, mode='w+', dtype=np.float64, shape=shape)
+        return self.paths
+
+    def close(self):
+        """
+        Écrit les chemins sur le disque et marque la simulation comme terminée.
+        """
+        self.paths.flush()
+        self.metadata['complete'] = True
+        self.write_metadata()
+
+    def write_metadata(self):
+        with open(self.metadata_file, 'w') as f:
+            json.dump(self.metadata, f)
+
+    def load(self):
+        """
+        Ouvre les chemins en lecture seule sans les charger en mémoire.
+        """
+        with open(self.metadata_file, 'r') as f:
+            self.metadata = json.load(f)
+        if not self.metadata['complete']:
+            raise ValueError(f"La simulation stockée dans {self.directory} est incomplète.")
+        self.paths = np.load(self.paths_file, mmap_mode='r')
+        return self.paths
+
+
+class StoredMonteCarlo(MonteCarlo):
+    def __init__(self, path_store, observation_frequency=None):
+        """
+        Relit une simulation stockée pour la réévaluer avec de nouveaux produits sans la resimuler.
+        S'utilise à la place d'un MonteCarlo dans Autocall et dans les graphiques.
+        :param path_store: PathStore contenant la simulation.
+        :param observation_frequency: Fréquence d'observation du produit (par défaut celle de la simulation).
+        """
+        self.path_store = path_store
+        self.paths = path_store.load()
+        metadata = path_store.metadata
+
+        self.stocks = []
+        self.tickers = metadata['tickers']
+        self.spots = np.array(metadata['spots'])
+        self.dividend_yields = np.array(metadata['dividend_yields'])
+        self.correlation_matrix = pd.DataFrame(metadata['correlation_matrix'], index=self.tickers,
+                                               columns=self.tickers)
+        self.start_date = datetime.strptime(metadata['start_date'], "%Y-%m-%d")
+        self.end_date = datetime.strptime(metadata['end_date'], "%Y-%m-%d")
+        self.maturity = metadata['maturity']
+        self.num_simu = metadata['num_simu']
+        self.day_conv = metadata['day_conv']
+        self.num_time_steps = metadata['num_time_steps']
+        self.delta_t = metadata['delta_t']
+        self.seed = metadata['seed']
+        self.num_factors = metadata.get('num_factors')
+        self.z = None
+
+        self.simulation_dates = pd.DatetimeIndex(metadata['simulation_dates'])
+        self.observation_frequency = observation_frequency or metadata['observation_frequency']
+        self.observation_dates = self.generate_observation_dates()
+
+        self.simulations = self.paths_to_dataframes(self.paths)
+        self.stocks_nb = len(self.simulations)
@@ -0,0 +1,183 @@
+import time
+import numpy as np
+import pandas as pd
+from backend.monte_carlo import MonteCarlo
+from backend.models import Autocall
+
+
+class ScenarioGrid:
+    def __init__(self, autocall, spot_shifts=None, vol_shifts=None, per_underlying=False, sticky='strike'):
+        """
+        Grille de scénarios spot/volatilité (risk ladder) d'un autocall.
+        Tous les scénarios réutilisent les chocs gaussiens du MonteCarlo de l'autocall et sont simulés en une seule
+        passe vectorisée, la dimension des scénarios s'ajoutant à celle des simulations.
+        :param autocall: Autocall de référence (fournit le MonteCarlo et les caractéristiques du produit).
+        :param spot_shifts: Chocs relatifs sur le spot (par défaut -30% à +30% par pas de 5%).
+        :param vol_shifts: Chocs absolus sur la volatilité (par défaut -5, 0 et +5 points).
+        :param per_underlying: Si True, chaque sous-jacent est choqué séparément, sinon tous ensemble.
+        :param sticky: 'strike' (volatilité lue au strike absolu) ou 'moneyness' (volatilité lue à la moneyness
+        d'origine, les chemins choqués en spot sont alors des homothéties des chemins non choqués).
+        """
+        if sticky not in ('strike', 'moneyness'):
+            raise ValueError("Convention de volatilité non reconnue.")
+        if autocall.monte_carlo.z is None:
+            raise ValueError("La grille de scénarios nécessite un MonteCarlo dont les chocs sont gardés en mémoire.")
+
+        self.autocall = autocall
+        self.monte_carlo = autocall.monte_carlo
+        self.spot_shifts = np.round(np.arange(-0.30, 0.30 + 1e-9, 0.05), 4) + 0.0 if spot_shifts is None \
+            else np.asarray(spot_shifts, dtype=float)
+        self.vol_shifts = np.array([-0.05, 0.0, 0.05]) if vol_shifts is None else np.asarray(vol_shifts, dtype=float)
+        self.per_underlying = per_underlying
+        self.sticky = sticky
+        self.underlyings = [stock.ticker for stock in self.monte_carlo.stocks] if per_underlying else ['Tous']
+        self.num_scenarios = len(self.underlyings) * len(self.spot_shifts) * len(self.vol_shifts)
+
+        start = time.perf_counter()
+        self.pv_cube, self.probability_cube = self.price_grid()
+        self.elapsed = time.perf_counter() - start
+
+        self.coords = {'underlying': self.underlyings,
+                       'spot_shift': self.spot_shifts,
+                       'vol_shift': self.vol_shifts,
+                       'observation_date': self.monte_carlo.observation_dates}
+        self.results = self.to_dataframe()
+
+    def shift_matrices(self):
+        """
+        Multiplicateurs de spot et chocs de volatilité de forme (nb_sous-jacents choqués, nb_chocs_spot,
+        nb_chocs_vol, nb_actifs).
+        """
+        num_assets = len(self.monte_carlo.stocks)
+        if self.per_underlying:
+            bumped = np.eye(num_assets)
+        else:
+            bumped = np.ones((1, num_assets))
+
+        bumped = bumped[:, None, None, :]
+        spot_multipliers = 1 + bumped * self.spot_shifts[None, :, None, None]
+        vol_shifts = bumped * self.vol_shifts[None, None, :, None]
+        spot_multipliers, vol_shifts = np.broadcast_arrays(spot_multipliers, vol_shifts)
+        return spot_multipliers, vol_shifts
+
+    def simulate_scenarios(self, spot_multipliers, vol_shifts, moneyness_scale):
+        """
+        Simule tous les scénarios en une passe avec les chocs du MonteCarlo de référence.
+        Les paramètres sont de forme (nb_scénarios, nb_actifs) ; seuls les prix aux dates d'observation sont
+        conservés, sous la forme (nb_scénarios, nb_dates, nb_simulations, nb_actifs).
+        """
+        mc = self.monte_carlo
+        dt = mc.delta_t
+        num_scenarios, num_assets = spot_multipliers.shape
+
+        volatilities = mc.volatility_interpolators()
+        rates = mc.rate_interpolators()
+
+        # Position de chaque date d'observation dans la grille de simulation
+        observation_steps = {step: k for k, step in
+                             enumerate(mc.simulation_dates.get_indexer(mc.observation_dates))}
+        prices = np.empty((num_scenarios, len(mc.observation_dates), mc.num_simu, num_assets))
+
+        current = np.repeat((mc.spots * spot_multipliers)[:, None, :], mc.num_simu, axis=1)
+        if 0 in observation_steps:
+            prices[:, observation_steps[0]] = current
+
+        for t in range(1, mc.num_time_steps + 1):
+            t_in_years = t / mc.day_conv
+            for i in range(num_assets):
+                lookup = (current[:, :, i] / moneyness_scale[:, None, i]).ravel()
+                volatility = volatilities[i]((t_in_years, lookup)).reshape(num_scenarios, mc.num_simu)
+                volatility = np.maximum(volatility + vol_shifts[:, None, i], 0.0)
+                rate = rates[i](t_in_years)
+                current[:, :, i] *= np.exp(
+                    (rate - mc.dividend_yields[i] - 0.5 * volatility ** 2) * dt + volatility * mc.z[t - 1, :, i])
+            if t in observation_steps:
+                prices[:, observation_steps[t]] = current
+
+        return prices
+
+    def price_grid(self):
+        """
+        Calcule le cube des prix (en % du nominal) et des probabilités d'autocall pour tous les scénarios.
+        """
+        mc = self.monte_carlo
+        spot_multipliers, vol_shifts = self.shift_matrices()
+        grid_shape = spot_multipliers.shape[:3]
+        num_assets = spot_multipliers.shape[-1]
+
+        if self.sticky == 'moneyness':
+            # La volatilité ne dépend que de la moneyness : on ne simule que les couches de volatilité et on déduit
+            # les scénarios de spot par homothétie des chemins
+            base_vol_shifts = vol_shifts[:, 0].reshape(-1, num_assets)
+            ones = np.ones_like(base_vol_shifts)
+            base_prices = self.simulate_scenarios(ones, base_vol_shifts, ones)
+            base_prices = base_prices.reshape(grid_shape[0], 1, grid_shape[2], *base_prices.shape[1:])
+            prices = base_prices * spot_multipliers[..., None, None, :]
+        else:
+            flat_multipliers = spot_multipliers.reshape(-1, num_assets)
+            prices = self.simulate_scenarios(flat_multipliers, vol_shifts.reshape(-1, num_assets),
+                                             np.ones_like(flat_multipliers))
+            prices = prices.reshape(*grid_shape, *prices.shape[1:])
+
+        # Les niveaux de référence du produit restent les spots non choqués
+        ratios = self.autocall.performance_ratios(prices, mc.spots)
+        _, discounted_payoffs, autocall_matrix = self.autocall.evaluate_ratios(ratios)
+
+        pv_cube = discounted_payoffs.sum(axis=-2).mean(axis=-1) / self.autocall.nominal * 100
+        probability_cube = autocall_matrix.sum(axis=-1) / mc.num_simu
+        return pv_cube, probability_cube
+
+    def to_dataframe(self):
+        """
+        Met le cube sous forme de DataFrame indexé par (sous-jacent, choc spot, choc vol), avec le prix et la
+        probabilité d'autocall à chaque date d'observation.
+        """
+        index = pd.MultiIndex.from_product([self.underlyings, self.spot_shifts, self.vol_shifts],
+                                           names=['Sous-jacent', 'Choc spot', 'Choc vol'])
+        columns = [date.strftime('%Y-%m-%d') for date in self.monte_carlo.observation_dates]
+        df = pd.DataFrame(self.probability_cube.reshape(-1, len(columns)), index=index, columns=columns)
+        df.insert(0, 'Prix', self.pv_cube.ravel())
+        return df
+
+    def pv_table(self, underlying=None):
+        """
+        Tableau des prix choc spot x choc vol pour un sous-jacent choqué (le premier par défaut).
+        """
+        underlying = self.underlyings[0] if underlying is None else underlying
+        return self.results.loc[underlying, 'Prix'].unstack('Choc vol')
+
+    def benchmark(self, num_runs=3):
+        """
+        Compare le coût de la grille à celui de N constructions indépendantes MonteCarlo + Autocall.
+        Seules num_runs constructions sont chronométrées : le temps des N calculs indépendants est une estimation
+        (temps moyen mesuré x N).
+        """
+        mc = self.monte_carlo
+        num_runs = min(num_runs, self.num_scenarios)
+        start = time.perf_counter()
+        for _ in range(num_runs):
+            monte_carlo = MonteCarlo(stocks=mc.stocks,
+                                     start_date=mc.start_date.strftime("%Y-%m-%d"),
+                                     end_date=mc.end_date.strftime("%Y-%m-%d"),
+                                     num_simu=mc.num_simu,
+                                     day_conv=mc.day_conv,
+                                     seed=mc.seed,
+                                     observation_frequency=mc.observation_frequency)
+            Autocall(monte_carlo=monte_carlo,
+                     strat=self.autocall.strat,
+                     nominal=self.autocall.nominal,
+                     coupon_rate=self.autocall.coupon_rate,
+                     coupon_barrier=self.autocall.coupon_barrier,
+                     autocall_barrier=self.autocall.autocall_barrier,
+                     put_barrier=self.autocall.put_barrier)
+        measured = time.perf_counter() - start
+
+        single_run = measured / num_runs
+        estimated_runs = single_run * self.num_scenarios
+        return {'Scénarios': self.num_scenarios,
+                'Temps grille (s)': self.elapsed,
+                'Calculs indépendants mesurés': num_runs,
+                'Temps mesuré des calculs indépendants (s)': measured,
+                'Temps moyen d\'un calcul (s)': single_run,
+                'Temps estimé des N calculs indépendants (s)': estimated_runs,
+                'Accélération estimée': estimated_runs / self.elapsed}
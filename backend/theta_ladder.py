@@ -0,0 +1,105 @@
+import time
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+
+class ThetaLadder:
+    def __init__(self, autocall, valuation_dates=None):
+        """
+        Profil de prix d'un autocall sur une suite de dates de valorisation (theta ladder), à marché constant :
+        le spot, la surface de volatilité et la courbe des taux vus de chaque date de valorisation sont ceux de la
+        date de pricing.
+        Les chemins de l'autocall de référence sont réutilisés : à marché constant, le chemin simulé depuis une
+        date de valorisation avec les mêmes chocs est le début du chemin de référence. Pour chaque date, seul le
+        calcul des payoffs sur l'échéancier restant est refait.
+        :param autocall: Autocall de référence, valorisé à la date de début du MonteCarlo.
+        :param valuation_dates: Dates de valorisation (par défaut la date de début puis chaque date d'observation
+        antérieure à la maturité).
+        """
+        self.autocall = autocall
+        self.monte_carlo = autocall.monte_carlo
+        self.valuation_dates = self.generate_valuation_dates(valuation_dates)
+
+        # Prix simulés de forme (nb_jours + 1, nb_simulations, nb_actifs), partagés par toutes les dates
+        self.prices = self.monte_carlo.paths
+
+        start = time.perf_counter()
+        self.results, self.probabilities = self.price_ladder()
+        self.elapsed = time.perf_counter() - start
+
+    def generate_valuation_dates(self, valuation_dates):
+        mc = self.monte_carlo
+        if valuation_dates is None:
+            dates = [mc.start_date] + [date for date in mc.observation_dates if date < mc.end_date]
+        else:
+            dates = [pd.Timestamp(date) for date in valuation_dates]
+
+        dates = pd.DatetimeIndex(dates).normalize().unique().sort_values()
+        if dates[0] < mc.start_date or dates[-1] >= mc.end_date:
+            raise ValueError("Les dates de valorisation doivent être comprises entre la date de début et la "
+                             "date de fin.")
+        return dates
+
+    def discount_factors(self, valuation_date, num_remaining):
+        """
+        Facteurs d'actualisation des dates d'observation restantes et de la maturité, avec la convention de
+        l'autocall appliquée à la maturité restante et la courbe des taux vue de la date de valorisation.
+        """
+        mc = self.monte_carlo
+        remaining_maturity = (mc.end_date - valuation_date).days / mc.day_conv
+        times = np.arange(num_remaining + 1) / num_remaining * remaining_maturity
+        # A marché constant, la courbe vue de la date de valorisation est celle de la date de pricing
+        rates = [self.autocall.risk_free.interpolate_rate(date=mc.start_date + timedelta(days=time * mc.day_conv))
+                 for time in times]
+        return np.exp(-np.array(rates) * times)
+
+    def price_date(self, valuation_date):
+        """
+        Valorise l'autocall à une date : les observations passées sont au niveau initial (marché constant), les
+        observations restantes sont lues sur le début des chemins de référence.
+        """
+        mc = self.monte_carlo
+        observation_dates = mc.observation_dates
+        remaining = observation_dates >= valuation_date
+        num_remaining = int(remaining.sum())
+        if num_remaining == 0:
+            # Toutes les observations sont passées : plus aucun flux à venir
+            return 0.0, 0, np.full(len(observation_dates), np.nan)
+
+        ratios = np.ones((len(observation_dates), mc.num_simu))
+        steps = (observation_dates[remaining] - valuation_date).days
+        ratios[remaining] = self.autocall.performance_ratios(self.prices[steps], self.prices[0])
+
+        # Les flux des dates passées sont déjà versés : ils ne font pas partie du prix
+        remaining_discounts = self.discount_factors(valuation_date, num_remaining)
+        discounts = np.zeros(len(observation_dates) + 1)
+        discounts[remaining.nonzero()[0]] = remaining_discounts[:-1]
+        discounts[-1] = remaining_discounts[-1]
+
+        _, discounted_payoffs, autocall_matrix = self.autocall.evaluate_ratios(ratios, discounts)
+        price = discounted_payoffs.sum(axis=0).mean() / self.autocall.nominal * 100
+        probabilities = autocall_matrix.sum(axis=1) / mc.num_simu
+        probabilities[~remaining] = np.nan
+        return price, num_remaining, probabilities
+
+    def price_ladder(self):
+        """
+        Calcule le prix (en % du nominal) et les probabilités d'autocall pour chaque date de valorisation.
+        """
+        rows, probabilities = [], []
+        for valuation_date in self.valuation_dates:
+            price, num_remaining, probas = self.price_date(valuation_date)
+            rows.append([price, num_remaining])
+            probabilities.append(probas)
+
+        results = pd.DataFrame(rows, index=self.valuation_dates, columns=['Prix', 'Observations restantes'])
+        results.index.name = 'Date de valorisation'
+        # Les dates de valorisation ne sont pas équidistantes : le theta est ramené à un jour calendaire
+        results['Variation de prix'] = results['Prix'].diff()
+        results['Theta (par jour)'] = results['Variation de prix'] / self.valuation_dates.to_series().diff().dt.days
+        df_probabilities = pd.DataFrame(probabilities, index=self.valuation_dates,
+                                        columns=[date.strftime('%Y-%m-%d') for date in
+                                                 self.monte_carlo.observation_dates])
+        df_probabilities.index.name = 'Date de valorisation'
+        return results, df_probabilities
@@ -1,28 +1,25 @@
 import matplotlib.pyplot as plt
 import streamlit as st
-import pandas as pd
 import matplotlib.dates as mdates
-from scipy.interpolate import griddata
 import numpy as np
 import plotly.graph_objects as go
 
 
 def plot_volatility_surface_streamlit(stocks_list):
     for stock in stocks_list:
-        volatility_df = stock.volatility_surface.data.copy()
-        volatility_df['Maturity_Date'] = pd.to_datetime(volatility_df['Maturity_Date'])
-        volatility_df['Dates_In_Years'] = volatility_df['Dates_In_Years'].astype(float)
-        volatility_df['Strike'] = volatility_df['Strike'].astype(float)
-
-        x = np.linspace(volatility_df['Dates_In_Years'].min(), volatility_df['Dates_In_Years'].max(),
-                        len(volatility_df['Dates_In_Years'].unique()))
-        y = np.linspace(volatility_df['Strike'].min(), volatility_df['Strike'].max(),
-                        len(volatility_df['Strike'].unique()))
+        volatility_df = stock.volatility_surface.data
+        # Même surface SVI que celle utilisée par les simulations, évaluée sur toute la grille en une fois
+        surface = stock.volatility_surface.interpolator()
+
+        x = np.linspace(volatility_df['Dates_In_Years'].min(), volatility_df['Dates_In_Years'].max(), 50)
+        y = np.linspace(volatility_df['Strike'].min(), volatility_df['Strike'].max(), 50)
         X, Y = np.meshgrid(x, y)
-        Z = griddata((volatility_df['Dates_In_Years'], volatility_df['Strike']),
-                     volatility_df['Implied_Volatility'], (X, Y), method='cubic')
+        Z = surface((X, Y))
 
-        fig = go.Figure(data=[go.Surface(z=Z, x=X, y=Y, colorscale='Viridis')])
+        fig = go.Figure(data=[go.Surface(z=Z, x=X, y=Y, colorscale='Viridis'),
+                              go.Scatter3d(x=volatility_df['Dates_In_Years'], y=volatility_df['Strike'],
+                                           z=volatility_df['Implied_Volatility'], mode='markers',
+                                           marker=dict(size=3, color='black'), name='Marché')])
 
         fig.update_layout(title=f'Implied Volatility Surface for {stock.ticker}', autosize=True,
                           scene=dict(
@@ -34,23 +31,24 @@ def plot_volatility_surface_streamlit(stocks_list):
 
 
 def plot_simulations_streamlit(autocall):
-    for actif_index, (df, stock) in enumerate(zip(autocall.monte_carlo.simulations, autocall.monte_carlo.stocks)):
+    monte_carlo = autocall.monte_carlo
+    for actif_index, ticker in enumerate(monte_carlo.tickers):
         fig, ax = plt.subplots(figsize=(10, 6))
 
-        # Convertir l'index en datetime si ce n'est pas déjà le cas
-        df.index = pd.to_datetime(df.index)
+        # Chemins de l'actif courant lus sans copie (éventuellement depuis le stockage sur disque)
+        paths = monte_carlo.paths[:, :, actif_index]
+        initial_price = paths[0, 0]
 
         # Tracer chaque simulation pour l'actif courant
-        for sim_index in df.columns:
-            ax.plot(df.index, df[sim_index], lw=1)
+        ax.plot(monte_carlo.simulation_dates, paths, lw=1)
 
         # Ajouter une ligne horizontale pour la barrière de coupon et d'autocall
-        ax.axhline(y=autocall.coupon_barrier * df.iloc[0, 0], color='g', linestyle='--',
-                   label=f'Coupon Barrier ({round(autocall.coupon_barrier * df.iloc[0, 0], 1)})')
-        ax.axhline(y=autocall.autocall_barrier * df.iloc[0, 0], color='r', linestyle='--',
-                   label=f'Autocall Barrier ({round(autocall.autocall_barrier * df.iloc[0, 0], 1)})')
-        ax.axhline(y=autocall.put_barrier * df.iloc[0, 0], color='orange', linestyle='--',
-                   label=f'Put Barrier ({round(autocall.put_barrier * df.iloc[0, 0], 1)})')
+        ax.axhline(y=autocall.coupon_barrier * initial_price, color='g', linestyle='--',
+                   label=f'Coupon Barrier ({round(autocall.coupon_barrier * initial_price, 1)})')
+        ax.axhline(y=autocall.autocall_barrier * initial_price, color='r', linestyle='--',
+                   label=f'Autocall Barrier ({round(autocall.autocall_barrier * initial_price, 1)})')
+        ax.axhline(y=autocall.put_barrier * initial_price, color='orange', linestyle='--',
+                   label=f'Put Barrier ({round(autocall.put_barrier * initial_price, 1)})')
 
         # Ajouter une ligne verticale pour chaque date d'observation
         for obs_date in autocall.monte_carlo.observation_dates:
@@ -61,7 +59,7 @@ def plot_simulations_streamlit(autocall):
         ax.xaxis.set_major_locator(mdates.AutoDateLocator())
         plt.xticks(rotation=45)
 
-        ax.set_title(f'Monte Carlo Simulation for {stock.ticker}')
+        ax.set_title(f'Monte Carlo Simulation for {ticker}')
         ax.set_xlabel('Time')
         ax.set_ylabel('Process Value')
         ax.grid(True, which='both', axis='y', linestyle='--', color='grey')